@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, date
+
+# statuses that count as "out of service" for fleet availability
+UNAVAILABLE_STATUSES = ("Unavailable", "Faulted")
+
+
+def split_by_day(start, end): #yields (day, seconds) for the part of [start, end) that falls on each day
+    while start < end:
+        next_day = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+        part_end = min(end, next_day)
+        yield start.date().isoformat(), (part_end - start).total_seconds()
+        start = part_end
+
+
+def record_status_change(conn, cp_id, new_status, now=None):
+    # closes the interval of the previous status into the daily aggregates and starts a new one
+    # caller commits, called from every route that changes charge_points.status
+    now = now or datetime.now()
+    if not conn.in_transaction: #take the write lock first so two requests can not close the same interval
+        conn.execute("BEGIN IMMEDIATE")
+    cp = conn.execute("SELECT status, status_since FROM charge_points WHERE cp_id=?", (cp_id,)).fetchone()
+    if cp and cp["status"] and cp["status_since"]:
+        since = datetime.fromisoformat(cp["status_since"])
+        for day, seconds in split_by_day(since, now):
+            conn.execute(
+                "INSERT INTO status_durations (day, cp_id, status, seconds) VALUES (?,?,?,?) "
+                "ON CONFLICT(day, cp_id, status) DO UPDATE SET seconds=seconds+excluded.seconds",
+                (day, cp_id, cp["status"], seconds)
+            )
+            conn.execute(
+                "INSERT INTO fleet_status_durations (day, status, seconds) VALUES (?,?,?) "
+                "ON CONFLICT(day, status) DO UPDATE SET seconds=seconds+excluded.seconds",
+                (day, cp["status"], seconds)
+            )
+    conn.execute("UPDATE charge_points SET status=?, status_since=? WHERE cp_id=?",
+                 (new_status, now.isoformat(), cp_id))
+
+
+def _summary(durations): #{status: seconds} -> totals and percentages
+    total = sum(durations.values())
+    unavailable = sum(durations.get(s, 0) for s in UNAVAILABLE_STATUSES)
+    return {
+        "durations": durations,
+        "total_seconds": total,
+        "availability_pct": round(100 * (total - unavailable) / total, 2) if total else None,
+        "utilisation_pct": round(100 * durations.get("Charging", 0) / total, 2) if total else None,
+    }
+
+
+def _add(target, status, seconds):
+    target[status] = target.get(status, 0) + seconds
+
+
+def get_analytics(conn, start_day, end_day, cp_id=None, now=None):
+    # reads the daily aggregates (one row per day/status for the fleet) and adds the still-open
+    # intervals of the current statuses, so cost grows with the number of days, not events
+    now = now or datetime.now()
+    first, last = start_day.isoformat(), end_day.isoformat()
+    range_start = datetime.combine(start_day, datetime.min.time())
+    range_end = min(now, datetime.combine(end_day + timedelta(days=1), datetime.min.time()))
+
+    fleet_days = {}
+    charge_points = {}
+    if cp_id is None:
+        for row in conn.execute(
+                "SELECT day, status, seconds FROM fleet_status_durations WHERE day BETWEEN ? AND ?", (first, last)):
+            _add(fleet_days.setdefault(row["day"], {}), row["status"], row["seconds"])
+        rows = conn.execute(
+            "SELECT day, cp_id, status, seconds FROM status_durations WHERE day BETWEEN ? AND ?", (first, last))
+        open_rows = conn.execute("SELECT cp_id, status, status_since FROM charge_points WHERE status_since IS NOT NULL")
+    else:
+        rows = conn.execute(
+            "SELECT day, cp_id, status, seconds FROM status_durations WHERE day BETWEEN ? AND ? AND cp_id=?",
+            (first, last, cp_id))
+        open_rows = conn.execute(
+            "SELECT cp_id, status, status_since FROM charge_points WHERE status_since IS NOT NULL AND cp_id=?", (cp_id,))
+
+    for row in rows:
+        _add(charge_points.setdefault(row["cp_id"], {}).setdefault(row["day"], {}), row["status"], row["seconds"])
+        if cp_id is not None:
+            _add(fleet_days.setdefault(row["day"], {}), row["status"], row["seconds"])
+
+    for row in open_rows: #current status, not yet closed by a status change
+        since = max(datetime.fromisoformat(row["status_since"]), range_start)
+        for day, seconds in split_by_day(since, range_end):
+            _add(charge_points.setdefault(row["cp_id"], {}).setdefault(day, {}), row["status"], seconds)
+            _add(fleet_days.setdefault(day, {}), row["status"], seconds)
+
+    fleet_total = {}
+    for durations in fleet_days.values():
+        for status, seconds in durations.items():
+            _add(fleet_total, status, seconds)
+
+    result_cps = {}
+    for cp, days in sorted(charge_points.items()):
+        cp_total = {}
+        for durations in days.values():
+            for status, seconds in durations.items():
+                _add(cp_total, status, seconds)
+        result_cps[cp] = dict(_summary(cp_total), days={d: days[d] for d in sorted(days)})
+
+    return {
+        "start": first,
+        "end": last,
+        "fleet": dict(_summary(fleet_total), days={d: _summary(fleet_days[d]) for d in sorted(fleet_days)}),
+        "charge_points": result_cps,
+    }
+
+
+def parse_day(value, default): #"YYYY-MM-DD" query arg -> date
+    if not value:
+        return default
+    return date.fromisoformat(value)
@@ -1,13 +1,18 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, g, Response
 from datetime import datetime, timedelta
 import logging
 from flask_cors import CORS
 import threading
 import time
 from flask import render_template
-from backend.database import get_db_connection, init_database, DB_PATH
+from backend.database import get_db_connection, init_database, insert_meter_values, DB_PATH
+from backend.analytics import record_status_change, get_analytics, parse_day
+from backend.response_cache import ResponseCache
+from backend.tracing import TraceStats, parse_stamps
+from profiler import SamplingProfiler, profiler_enabled
 import random 
 import os
+from collections import defaultdict, deque
 # Flask
 app = Flask(__name__, template_folder="../frontend/templates")
 CORS(app)
@@ -20,6 +25,27 @@ if os.path.exists(DB_PATH):
 
 init_database()
 
+# cached dashboard responses, every route that changes what they show calls response_cache.bump()
+response_cache = ResponseCache()
+
+
+# per-stage latency of traced messages (X-Trace-Id / X-Trace-Stamps headers added by the OCPP server)
+trace_stats = TraceStats()
+
+@app.before_request
+def trace_start():
+    if "X-Trace-Id" in request.headers:
+        g.trace_stamps = parse_stamps(request.headers.get("X-Trace-Stamps", ""))
+        g.trace_stamps["backend_recv"] = time.monotonic_ns()
+
+@app.after_request
+def trace_end(response):
+    stamps = g.pop("trace_stamps", None)
+    if stamps is not None:
+        stamps["backend_done"] = time.monotonic_ns()
+        trace_stats.record(request.path, stamps)
+    return response
+
 
 # pages (main, logs)
 @app.route("/")
@@ -52,6 +78,7 @@ ALL_DEVICES = [
 ]
 
 @app.route("/api/charge_points")
+@response_cache.cached
 def get_charge_points():
     conn = get_db_connection()
     cps = conn.execute("SELECT * FROM charge_points ORDER BY cp_id").fetchall()
@@ -62,14 +89,15 @@ def get_charge_points():
         for dev in selected_devices:
             now = datetime.now()
             conn.execute(
-                "INSERT INTO charge_points (cp_id,vendor,model,status,last_seen,busy,last_heartbeat) VALUES (?,?,?,?,?,?,?)",
-                (dev["cp_id"], dev["vendor"], dev["model"], "Available", now.isoformat(), 0, now.isoformat())
+                "INSERT INTO charge_points (cp_id,vendor,model,status,last_seen,busy,last_heartbeat,status_since) VALUES (?,?,?,?,?,?,?,?)",
+                (dev["cp_id"], dev["vendor"], dev["model"], "Available", now.isoformat(), 0, now.isoformat(), now.isoformat())
             )
             conn.execute(
                 "INSERT INTO boot_notifications (cp_id,vendor,model,timestamp) VALUES (?,?,?,?)",
                 (dev["cp_id"], dev["vendor"], dev["model"], now.isoformat())
             )
         conn.commit()
+        response_cache.bump()
         cps = conn.execute("SELECT * FROM charge_points ORDER BY cp_id").fetchall()
 
     # model info
@@ -168,15 +196,30 @@ def get_charge_points(): #GET
     return jsonify([dict(cp) for cp in cps]) #dict cevir json gonder
 
 '''
+# commands waiting to be picked up by the simulated clients (/next_command/<cp_id>), as (command, queued_at)
+# only chargers that polled recently get a queue (the demo chargers never poll), old commands are not replayed
+COMMAND_POLL_WINDOW = 30  # seconds since the last /next_command poll
+COMMAND_TTL = 60          # seconds a queued command stays valid
+MAX_PENDING_COMMANDS = 10  # per charger, the oldest command is dropped beyond this
+pending_commands = defaultdict(lambda: deque(maxlen=MAX_PENDING_COMMANDS))
+last_command_poll = {}  # cp_id -> time.monotonic() of its last poll
+pending_commands_lock = threading.Lock()
+
 #sending command
 @app.route("/api/send_command/<cp_id>", methods=["POST"]) #sending command with calling api
 def send_command(cp_id): #which evc this command is going to
     cmd = request.json.get("command")
-    status_map = {"start":"Charging","suspend":"SuspendedEVC","finish":"Available"}
+    status_map = {"start":"Charging","suspend":"SuspendedEV","finish":"Available"}
     new_status = status_map.get(cmd,"Available")
     busy = 1 if cmd=="start" else 0
+    now = time.monotonic()
+    with pending_commands_lock:
+        queued = now - last_command_poll.get(cp_id, float("-inf")) < COMMAND_POLL_WINDOW
+        if queued:
+            pending_commands[cp_id].append((cmd, now))
 
     conn = get_db_connection()
+    record_status_change(conn, cp_id, new_status)
     conn.execute("UPDATE charge_points SET status=?, busy=?, last_seen=? WHERE cp_id=?",
                  (new_status, busy, datetime.now(), cp_id))
     conn.execute(
@@ -184,9 +227,24 @@ def send_command(cp_id): #which evc this command is going to
         (cp_id,new_status,datetime.now().isoformat())
     )
     conn.commit(); conn.close() #for updating the last thing
-
-    logger.info(f"{cp_id} -> {cmd} -> {new_status} (busy={busy})")
-    return jsonify({"status":"ok","new_status":new_status,"busy":busy})
+    response_cache.bump()
+
+    logger.info(f"{cp_id} -> {cmd} -> {new_status} (busy={busy}, queued={queued})")
+    return jsonify({"status":"ok","new_status":new_status,"busy":busy,"queued":queued})
+
+@app.route("/next_command/<cp_id>") #polled by the client, returns the oldest pending command
+def next_command(cp_id):
+    now = time.monotonic()
+    cmd = None
+    with pending_commands_lock:
+        last_command_poll[cp_id] = now
+        queue = pending_commands.get(cp_id)
+        while queue:
+            cmd, queued_at = queue.popleft()
+            if now - queued_at < COMMAND_TTL:
+                break
+            cmd = None  # expired, skip
+    return jsonify({"command": cmd})
 
 @app.route("/heartbeat", methods=["POST"])
 def heartbeat():
@@ -204,11 +262,13 @@ def heartbeat():
     )
     conn.commit()
     conn.close()
+    response_cache.bump()
 
     return jsonify({"status": "heartbeat received", "cpId": cp_id}), 200
 
 #added new endpoint for evc info page 
 @app.route("/api/evc_details")
+@response_cache.cached
 def get_evc_details():
     conn = get_db_connection()
     cps = conn.execute("SELECT * FROM charge_points ORDER BY cp_id").fetchall()
@@ -244,15 +304,18 @@ def boot_notification():
     model = data.get("chargePointModel", "Unknown")
 
     conn = get_db_connection()
+    now = datetime.now()
     conn.execute(
         "INSERT INTO boot_notifications (cp_id, vendor, model, timestamp) VALUES (?,?,?,?)",
-        (cp_id, vendor, model, datetime.now().isoformat())
+        (cp_id, vendor, model, now.isoformat())
     )
+    record_status_change(conn, cp_id, "Available", now) #close the status interval before the row is replaced
     conn.execute(
-        "INSERT OR REPLACE INTO charge_points (cp_id, vendor, model, status, last_seen, busy, last_heartbeat) VALUES (?,?,?,?,?,?,?)",
-        (cp_id, vendor, model, "Available", datetime.now(), 0, None)
+        "INSERT OR REPLACE INTO charge_points (cp_id, vendor, model, status, last_seen, busy, last_heartbeat, status_since) VALUES (?,?,?,?,?,?,?,?)",
+        (cp_id, vendor, model, "Available", now, 0, None, now.isoformat())
     )
     conn.commit(); conn.close()
+    response_cache.bump()
 
     return jsonify({"status": "BootNotification stored"}), 200
 
@@ -267,16 +330,116 @@ def status_notification():
         "INSERT INTO status_notifications (cp_id, status, timestamp) VALUES (?,?,?)",
         (cp_id, status, datetime.now().isoformat())
     )
+    record_status_change(conn, cp_id, status)
     conn.execute(
         "UPDATE charge_points SET status=?, last_seen=? WHERE cp_id=?",
         (status, datetime.now(), cp_id)
     )
     conn.commit(); conn.close()
+    response_cache.bump()
 
     return jsonify({"status": "StatusNotification stored"}), 200
 
+@app.route("/starttransaction", methods=["POST"])
+def start_transaction():
+    data = request.json or {}
+    transaction_id = data.get("transactionId")
+    if transaction_id is None:
+        return jsonify({"error": "transactionId missing"}), 400
+
+    conn = get_db_connection()
+    # meter values may arrive first and create the row, so upsert instead of insert
+    conn.execute(
+        "INSERT INTO transactions (transaction_id, cp_id, connector_id, id_tag, meter_start, start_time) VALUES (?,?,?,?,?,?) "
+        "ON CONFLICT(transaction_id) DO UPDATE SET cp_id=excluded.cp_id, connector_id=excluded.connector_id, "
+        "id_tag=excluded.id_tag, meter_start=excluded.meter_start, start_time=excluded.start_time",
+        (transaction_id, data.get("cpId"), data.get("connectorId"), data.get("idTag"),
+         data.get("meterStart"), data.get("timestamp") or datetime.now().isoformat())
+    )
+    conn.commit(); conn.close()
+
+    return jsonify({"status": "StartTransaction stored", "transactionId": transaction_id}), 200
+
+@app.route("/api/transactions/next_id") #used by the OCPP server at startup to continue the transaction id sequence
+def next_transaction_id():
+    conn = get_db_connection()
+    row = conn.execute("SELECT MAX(transaction_id) AS max_id FROM transactions").fetchone()
+    conn.close()
+    return jsonify({"nextId": (row["max_id"] or 0) + 1})
+
+@app.route("/stoptransaction", methods=["POST"])
+def stop_transaction():
+    data = request.json or {}
+    transaction_id = data.get("transactionId")
+    if transaction_id is None:
+        return jsonify({"error": "transactionId missing"}), 400
+
+    conn = get_db_connection()
+    conn.execute(
+        "INSERT INTO transactions (transaction_id, cp_id, meter_stop, stop_time, stop_reason) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(transaction_id) DO UPDATE SET meter_stop=excluded.meter_stop, "
+        "stop_time=excluded.stop_time, stop_reason=excluded.stop_reason",
+        (transaction_id, data.get("cpId"), data.get("meterStop"),
+         data.get("timestamp") or datetime.now().isoformat(), data.get("reason") or "Local")
+    )
+    conn.commit(); conn.close()
+
+    return jsonify({"status": "StopTransaction stored", "transactionId": transaction_id}), 200
+
+@app.route("/metervalues", methods=["POST"])
+def meter_values():
+    # bulk insert, body is columnar: {"transactions": [{transactionId, cpId, connectorId, timestamp[], measurand[], ...}]}
+    data = request.json or {}
+    transactions = data.get("transactions") or []
+
+    conn = get_db_connection()
+    samples, rejected = insert_meter_values(conn, transactions)  # bad entries are skipped, not the whole body
+    conn.commit(); conn.close()
+    if rejected:
+        logger.warning(f"/metervalues rejected transactions {rejected}")
+
+    return jsonify({"status": "MeterValues stored", "samples": samples, "rejected": rejected}), 200
+
+@app.route("/api/analytics") #time per status per charger per day + fleet availability
+def analytics():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&cp_id=... (defaults: end=today, start=end, all chargers)
+    try:
+        end = parse_day(request.args.get("end"), datetime.now().date())
+        start = parse_day(request.args.get("start"), end)
+    except ValueError:
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+    if end < start:
+        return jsonify({"error": "end is before start"}), 400
+
+    conn = get_db_connection()
+    result = get_analytics(conn, start, end, request.args.get("cp_id"))
+    conn.close()
+    return jsonify(result)
+
+@app.route("/api/trace_stats", methods=["GET", "DELETE"]) #latency histograms per endpoint and stage, DELETE resets
+def get_trace_stats():
+    if request.method == "DELETE":
+        trace_stats.reset()
+        return jsonify({"status": "trace stats reset"})
+    return jsonify(trace_stats.to_dict())
+
+@app.route("/api/profile") #hot stacks of the backend process, only with OCPP_PROFILER=1
+def profile():
+    if not profiler_enabled():
+        return jsonify({"error": "profiler disabled, set OCPP_PROFILER=1"}), 404
+    try:
+        seconds = float(request.args.get("seconds", 5))
+        limit = int(request.args.get("limit", 50))
+    except ValueError:
+        return jsonify({"error": "seconds must be a number and limit an integer"}), 400
+    if not 0 < seconds <= 60 or limit < 1: #also rejects nan
+        return jsonify({"error": "seconds must be in (0, 60] and limit >= 1"}), 400
+    sampler = SamplingProfiler().run(seconds) #blocks this request thread only
+    return Response(sampler.collapsed(limit), mimetype="text/plain")
+
 
 @app.route("/api/logs") #get all the info from message tables 
+@response_cache.cached
 def get_logs():
     conn = get_db_connection()
     logs = []
@@ -297,6 +460,7 @@ def heartbeat_loop(): #which evc is active (avaliable)
             conn = get_db_connection()
             now = datetime.now()
             clients = conn.execute("SELECT cp_id,busy,last_heartbeat FROM charge_points").fetchall()
+            sent = 0
             for c in clients:
                 last_hb = c["last_heartbeat"]
                 if c["busy"]==0 and (last_hb is None or datetime.fromisoformat(last_hb) + timedelta(seconds=60) <= now):
@@ -305,8 +469,11 @@ def heartbeat_loop(): #which evc is active (avaliable)
                     conn.execute("UPDATE charge_points SET last_heartbeat=? WHERE cp_id=?",
                                  (now.isoformat(), c["cp_id"]))
                     logger.info(f"Heartbeat sent for {c['cp_id']}")
+                    sent += 1
             conn.commit()
             conn.close()
+            if sent:
+                response_cache.bump()
         except Exception as e:
             logger.error(f"Heartbeat loop error: {e}")
         time.sleep(10)  # control
@@ -1,6 +1,7 @@
 import sqlite3
 from datetime import datetime
 import logging
+from server.ocpp_schemas import MAX_TRANSACTION_ID
 
 DB_PATH = "ocpp_logs.db"
 
@@ -13,6 +14,7 @@ def get_db_connection(): #connection to db
 def init_database():
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL") #bulk meter writes do not block dashboard reads
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS charge_points (
             cp_id TEXT PRIMARY KEY,
@@ -21,7 +23,8 @@ def init_database():
             status TEXT,
             last_seen TIMESTAMP,
             busy INTEGER DEFAULT 0,
-            last_heartbeat TIMESTAMP
+            last_heartbeat TIMESTAMP,
+            status_since TIMESTAMP
         )
     ''')
     cursor.execute('''
@@ -42,5 +45,88 @@ def init_database():
             cp_id TEXT, vendor TEXT, model TEXT, timestamp TEXT
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id INTEGER PRIMARY KEY,
+            cp_id TEXT, connector_id INTEGER, id_tag TEXT,
+            meter_start INTEGER, meter_stop INTEGER,
+            start_time TEXT, stop_time TEXT, stop_reason TEXT
+        )
+    ''')
+    # one row per sample, clustered by (transaction_id, timestamp); timestamp is epoch seconds
+    # phase/location are '' when the charger did not send them, kWh/kW/... are stored as Wh/W/...
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meter_values (
+            transaction_id INTEGER NOT NULL,
+            timestamp REAL NOT NULL,
+            measurand TEXT NOT NULL,
+            phase TEXT NOT NULL DEFAULT '',
+            location TEXT NOT NULL DEFAULT '',
+            unit TEXT,
+            value REAL,
+            PRIMARY KEY (transaction_id, timestamp, measurand, phase, location)
+        ) WITHOUT ROWID
+    ''')
+    # seconds spent in each status per day, kept up to date by analytics.record_status_change
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS status_durations (
+            day TEXT NOT NULL, cp_id TEXT NOT NULL, status TEXT NOT NULL,
+            seconds REAL DEFAULT 0,
+            PRIMARY KEY (day, cp_id, status)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fleet_status_durations (
+            day TEXT NOT NULL, status TEXT NOT NULL,
+            seconds REAL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        ) WITHOUT ROWID
+    ''')
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+def insert_meter_values(conn, transactions): #bulk insert of /metervalues bodies, returns (new rows, rejected transaction ids)
+    # body is columnar: [{transactionId, cpId, connectorId, timestamp[], measurand[], phase[], location[], unit[], value[]}]
+    # a sample that is already stored (same key, e.g. resent after a reconnect) is ignored, never overwritten
+    # every transaction is inserted in its own savepoint, a bad one is rolled back and reported, the others are kept
+    inserted = 0
+    rejected = []
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    for t in transactions:
+        transaction_id = t.get("transactionId") if isinstance(t, dict) else None
+        if transaction_id is None:
+            continue
+        if type(transaction_id) is not int or not 0 < transaction_id <= MAX_TRANSACTION_ID:
+            rejected.append(transaction_id)
+            continue
+        conn.execute("SAVEPOINT meter_values_entry")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO transactions (transaction_id, cp_id, connector_id) VALUES (?,?,?)",
+                (transaction_id, t.get("cpId"), t.get("connectorId"))
+            )
+            count = len(t.get("value", []))
+            rows = zip(
+                [transaction_id] * count,
+                t.get("timestamp", []),
+                t.get("measurand", []),
+                [p or "" for p in t.get("phase") or [None] * count],
+                [l or "" for l in t.get("location") or [None] * count],
+                t.get("unit") or [None] * count,
+                t.get("value", []),
+            )
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO meter_values (transaction_id, timestamp, measurand, phase, location, unit, value) "
+                "VALUES (?,?,?,?,?,?,?)",
+                rows
+            )
+        except (sqlite3.Error, OverflowError, TypeError, ValueError) as e:
+            conn.execute("ROLLBACK TO meter_values_entry")
+            conn.execute("RELEASE meter_values_entry")
+            logging.warning(f"meter values of transaction {transaction_id} rejected: {e}")
+            rejected.append(transaction_id)
+            continue
+        conn.execute("RELEASE meter_values_entry")
+        inserted += cursor.rowcount
+    return inserted, rejected
@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import threading
+from functools import wraps
+
+from flask import request, Response
+
+
+class CacheEntry:
+    __slots__ = ("version", "etag", "body", "gzip_body")
+
+    def __init__(self, version, body):
+        self.version = version
+        self.etag = hashlib.sha1(body).hexdigest()[:20]  # strong etag, derived from the bytes served
+        self.body = body
+        self.gzip_body = None  # compressed on first gzip request, then shared by all clients
+
+
+class ResponseCache:
+    # caches serialized JSON bodies until the data version changes
+    # ingest routes call bump() after every write, readers never touch the db while the version is the same
+    def __init__(self, min_gzip_size=1024):
+        self.enabled = True
+        self.min_gzip_size = min_gzip_size  # small bodies are not worth compressing
+        self.version = 0
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.build_locks = {}  # one lock per key so only one thread re-queries after a bump
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+
+    def get(self, key, build):
+        # build() returns the response body (bytes), only called when the cached entry is stale
+        entry = self.entries.get(key)
+        if entry is not None and entry.version == self.version:
+            return entry
+        with self.lock:
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            entry = self.entries.get(key)
+            version = self.version  # read before querying, a bump during build makes the entry stale again
+            if entry is not None and entry.version == version:
+                return entry
+            body = build()
+            if entry is not None and hashlib.sha1(body).hexdigest()[:20] == entry.etag:
+                entry.version = version  # same bytes, keep the etag and the compressed body
+            else:
+                entry = CacheEntry(version, body)
+                self.entries[key] = entry
+            return entry
+
+    def gzip_body(self, entry):
+        if entry.gzip_body is None:
+            entry.gzip_body = gzip.compress(entry.body, compresslevel=6, mtime=0)
+        return entry.gzip_body
+
+    def cached(self, view):
+        # decorator for GET json views: adds ETag/If-None-Match (304) and gzip
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+
+            # keyed on the path only: the cached views take no query args, so cache-busters like ?_=<ts>
+            # must not create new entries (entries are never evicted)
+            entry = self.get(request.path, lambda: view(*args, **kwargs).get_data())
+            use_gzip = len(entry.body) >= self.min_gzip_size and request.accept_encodings["gzip"] > 0
+            # gzip and identity are different representations, so they get different strong etags
+            etag = entry.etag + "-gz" if use_gzip else entry.etag
+
+            headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+            if request.if_none_match.contains(etag):
+                response = Response(status=304, headers=headers)
+            elif use_gzip:
+                response = Response(self.gzip_body(entry), mimetype="application/json", headers=headers)
+                response.headers["Content-Encoding"] = "gzip"
+            else:
+                response = Response(entry.body, mimetype="application/json", headers=headers)
+            response.set_etag(etag)
+            return response
+        return wrapper
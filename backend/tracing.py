@@ -0,0 +1,105 @@
+import threading
+
+# stamps written along the path of one traced message, in order (time.monotonic_ns(), all processes on one host)
+STAGE_STAMPS = [
+    "client_send",     # Client.send_message, before websocket.send
+    "server_recv",     # Server.handle_message, frame received
+    "server_replied",  # Server.handle_message, CALLRESULT sent
+    "rest_dequeued",   # Server._log_action_to_rest task started (time in the pending task queue before it)
+    "rest_sent",       # Server._post_to_rest, just before the aiohttp POST
+    "backend_recv",    # Flask before_request
+    "backend_done",    # Flask after_request (route + SQLite commit)
+]
+
+# latency between two consecutive stamps
+STAGES = {
+    "ws_transit":    ("client_send", "server_recv"),
+    "server_handle": ("server_recv", "server_replied"),
+    "rest_queue":    ("server_replied", "rest_dequeued"),
+    "rest_prepare":  ("rest_dequeued", "rest_sent"),
+    "http_transit":  ("rest_sent", "backend_recv"),
+    "backend_route": ("backend_recv", "backend_done"),
+    "end_to_end":    ("client_send", "backend_done"),
+}
+
+BUCKETS = 32  # bucket i holds latencies below 2**i microseconds
+
+
+class LatencyHistogram:
+    __slots__ = ("count", "total_us", "max_us", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, us):
+        self.count += 1
+        self.total_us += us
+        self.max_us = max(self.max_us, us)
+        self.buckets[min(us.bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, p): #upper bound of the bucket that holds the p-th percentile, in ms
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** i, self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_us / self.count / 1000, 3) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_us / 1000,
+            "buckets_us": {f"<{2 ** i}": n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+def parse_stamps(header): #X-Trace-Stamps: "stage=ns,stage=ns" -> {stage: ns}, unknown stages are dropped
+    stamps = {}
+    for part in header.split(","):
+        stage, _, value = part.partition("=")
+        if stage in STAGE_STAMPS and value.isdigit():
+            stamps[stage] = int(value)
+    return stamps
+
+
+class TraceStats:
+    # per (endpoint, stage) latency histograms, fed by the Flask request hooks
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.traces = 0
+
+    def record(self, endpoint, stamps):
+        with self.lock:
+            self.traces += 1
+            for stage, (start, end) in STAGES.items():
+                if start in stamps and end in stamps:
+                    us = max(0, (stamps[end] - stamps[start]) // 1000)
+                    key = (endpoint, stage)
+                    histogram = self.histograms.get(key)
+                    if histogram is None:
+                        histogram = self.histograms[key] = LatencyHistogram()
+                    histogram.add(us)
+
+    def to_dict(self):
+        with self.lock:
+            result = {"traces": self.traces, "stages": list(STAGES), "endpoints": {}}
+            for endpoint in sorted({endpoint for endpoint, _ in self.histograms}):
+                result["endpoints"][endpoint] = {
+                    stage: self.histograms[(endpoint, stage)].to_dict()
+                    for stage in STAGES if (endpoint, stage) in self.histograms
+                }
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.traces = 0
@@ -0,0 +1,75 @@
+"""
+Requests/sec and bytes served for the dashboard APIs with 50 concurrent clients
+(run from the project root, note that importing the app recreates ocpp_logs.db):
+    python -m benchmarks.bench_dashboard_cache
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from backend.app import app, response_cache
+from backend.database import get_db_connection
+
+CLIENTS = 50
+REQUESTS_PER_CLIENT = 40
+ENDPOINTS = ["/api/charge_points", "/api/evc_details", "/api/logs"]
+CHARGE_POINTS = 200
+STATUS_ROWS = 20000  # makes /api/logs a multi-megabyte response
+
+
+def seed():
+    conn = get_db_connection()
+    now = datetime.now()
+    conn.executemany(
+        "INSERT OR REPLACE INTO charge_points (cp_id,vendor,model,status,last_seen,busy,last_heartbeat,status_since) VALUES (?,?,?,?,?,?,?,?)",
+        [(f"BENCH_{i}", "Vendor", "Model", "Available", now.isoformat(), 0, now.isoformat(), now.isoformat())
+         for i in range(CHARGE_POINTS)]
+    )
+    conn.executemany(
+        "INSERT INTO status_notifications (cp_id,status,timestamp) VALUES (?,?,?)",
+        [(f"BENCH_{i % CHARGE_POINTS}", "Charging", (now - timedelta(seconds=i)).isoformat()) for i in range(STATUS_ROWS)]
+    )
+    conn.commit(); conn.close()
+    response_cache.bump()
+
+
+def dashboard(stats, lock, gzip, conditional):
+    client = app.test_client()
+    etags = {}
+    served = requests = 0
+    for i in range(REQUESTS_PER_CLIENT):
+        url = ENDPOINTS[i % len(ENDPOINTS)]
+        headers = {"Accept-Encoding": "gzip"} if gzip else {}
+        if conditional and url in etags:
+            headers["If-None-Match"] = etags[url]
+        resp = client.get(url, headers=headers)
+        if resp.headers.get("ETag"):
+            etags[url] = resp.headers["ETag"]
+        served += len(resp.data)
+        requests += 1
+    with lock:
+        stats["bytes"] += served
+        stats["requests"] += requests
+
+
+def run(name, enabled, gzip, conditional):
+    response_cache.enabled = enabled
+    response_cache.bump()  # start every mode from a cold cache
+    stats = {"bytes": 0, "requests": 0}
+    lock = threading.Lock()
+    threads = [threading.Thread(target=dashboard, args=(stats, lock, gzip, conditional)) for _ in range(CLIENTS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<26} {stats['requests'] / elapsed:8.1f} req/s  {stats['bytes'] / 1e6:9.2f} MB served")
+
+
+if __name__ == "__main__":
+    seed()
+    run("no cache", enabled=False, gzip=False, conditional=False)
+    run("cache", enabled=True, gzip=False, conditional=False)
+    run("cache + gzip", enabled=True, gzip=True, conditional=False)
+    run("cache + gzip + ETag (304)", enabled=True, gzip=True, conditional=True)
@@ -0,0 +1,75 @@
+"""
+MeterValues ingestion throughput against the 1 sample/second/connector x 10k connectors target
+(run from the project root, writes a temporary sqlite db):
+    python -m benchmarks.bench_meter_values
+
+One simulated second = one MeterValues frame per connector, going through the same steps as
+Server.handle_message (json decode, frame check, schema validation, buffering, CALLRESULT
+encoding), then one flush: /metervalues body encoding and the backend bulk insert.
+"""
+import json
+import os
+import tempfile
+import time
+
+from backend import database
+from server.meter_buffer import MeterValueBuffer
+from server.ocpp_schemas import parse_call, validate_payload
+
+CONNECTORS = 10000
+SECONDS = 5
+
+
+def frames(second):
+    timestamp = f"2025-08-19T10:00:{second:02d}Z"
+    for connector in range(CONNECTORS):
+        yield json.dumps([2, f"{second}-{connector}", "MeterValues", {
+            "connectorId": 1, "transactionId": connector + 1, "meterValue": [{
+                "timestamp": timestamp,
+                "sampledValue": [
+                    {"value": str(1000 + second), "measurand": "Energy.Active.Import.Register", "unit": "Wh"},
+                    {"value": "9000", "measurand": "Power.Active.Import", "unit": "W"},
+                ],
+            }],
+        }])
+
+
+def main():
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_meter_values.db")
+    database.init_database()
+    conn = database.get_db_connection()
+    buffer = MeterValueBuffer(max_samples=10 ** 9)
+    handle_total = flush_total = 0.0
+    samples = 0
+
+    for second in range(SECONDS):
+        raw_frames = list(frames(second))  # encoding on the charger side is not part of the measurement
+
+        start = time.perf_counter()
+        for raw in raw_frames:
+            message_id, action, payload = parse_call(json.loads(raw))
+            validate_payload(action, payload, message_id)
+            buffer.add("CP", payload["connectorId"], payload["transactionId"], payload["meterValue"])
+            json.dumps([3, message_id, {}])
+        handle = time.perf_counter() - start
+
+        start = time.perf_counter()
+        body = json.loads(json.dumps({"transactions": buffer.drain()}))  # server encode + backend decode
+        samples += database.insert_meter_values(conn, body["transactions"])[0]
+        conn.commit()
+        flush = time.perf_counter() - start
+
+        handle_total += handle
+        flush_total += flush
+        print(f"second {second}: handle {handle * 1000:7.1f} ms  flush+insert {flush * 1000:7.1f} ms  "
+              f"({CONNECTORS / (handle + flush):,.0f} msg/s)")
+
+    conn.close()
+    per_second = (handle_total + flush_total) / SECONDS
+    print(f"{samples} samples stored, {per_second * 1000:.1f} ms of work per simulated second "
+          f"({'meets' if per_second < 1 else 'MISSES'} 1 sample/s x {CONNECTORS} connectors, "
+          f"{per_second * 100:.0f}% of one core)")
+
+
+if __name__ == "__main__":
+    main()
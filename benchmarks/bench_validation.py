@@ -0,0 +1,51 @@
+"""
+Validation overhead per message (run from the project root):
+    python -m benchmarks.bench_validation
+"""
+import json
+import timeit
+
+from server.ocpp_schemas import parse_call, validate_payload
+
+FRAMES = {
+    "BootNotification": [2, "1", "BootNotification", {
+        "chargePointVendor": "MyVendor", "chargePointModel": "MyModel",
+        "chargePointSerialNumber": "1234567890", "firmwareVersion": "1.0.0",
+    }],
+    "Heartbeat": [2, "2", "Heartbeat", {}],
+    "StatusNotification": [2, "3", "StatusNotification", {
+        "connectorId": 0, "errorCode": "NoError", "status": "Charging",
+        "timestamp": "2025-08-19T10:00:00Z",
+    }],
+    "MeterValues": [2, "4", "MeterValues", {
+        "connectorId": 1, "transactionId": 1, "meterValue": [{
+            "timestamp": "2025-08-19T10:00:00Z",
+            "sampledValue": [
+                {"value": "1234", "measurand": "Energy.Active.Import.Register", "unit": "Wh"},
+                {"value": "9000", "measurand": "Power.Active.Import", "unit": "W"},
+            ],
+        }],
+    }],
+}
+
+NUMBER = 100000
+
+
+def bench(action, frame):
+    raw = json.dumps(frame)
+
+    def decode_only():
+        json.loads(raw)
+
+    def decode_and_validate():
+        message_id, name, payload = parse_call(json.loads(raw))
+        validate_payload(name, payload, message_id)
+
+    base = min(timeit.repeat(decode_only, number=NUMBER, repeat=3)) / NUMBER
+    full = min(timeit.repeat(decode_and_validate, number=NUMBER, repeat=3)) / NUMBER
+    print(f"{action:<20} json.loads {base * 1e6:6.2f} us  + validation {(full - base) * 1e6:6.2f} us/msg")
+
+
+if __name__ == "__main__":
+    for action, frame in FRAMES.items():
+        bench(action, frame)
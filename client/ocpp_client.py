@@ -11,6 +11,8 @@ import random
 # from client.simulation import StationManager
 import aiohttp
 import sys
+import os
+import time
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,7 +20,7 @@ logging.basicConfig(
 )
 
 class Client:
-    def __init__(self, charge_point_id, server_url="wss://localhost:8080", use_ssl=True):
+    def __init__(self, charge_point_id, server_url="wss://localhost:8080", use_ssl=True, meter_interval=None):
         self.server_url = server_url
         self.charge_point_id = charge_point_id
         self.use_ssl = use_ssl
@@ -34,6 +36,17 @@ class Client:
         self.status = 'Available'  # initial status to be shown
         self.connected = False  # connection status with server
         self.logger = logging.getLogger('Client')
+        self.pending_calls = {}  # messageId -> action, to match CALLRESULTs with their request
+        self.transaction_id = None  # set from StartTransaction.conf
+        self.meter_task = None
+        # seconds between MeterValues while Charging
+        if meter_interval is None:
+            meter_interval = float(os.environ.get('METER_VALUES_INTERVAL', '1.0'))
+        self.meter_interval = meter_interval
+        self.meter_wh = 0.0  # energy register of the simulated meter
+        self.power_w = 0.0
+        # OCPP_TRACE=1 adds {"traceId", "stamps"} as a 5th frame element, see backend/tracing.py
+        self.trace = os.environ.get('OCPP_TRACE') == '1'
         
     async def start(self):
         while True:
@@ -67,10 +80,8 @@ class Client:
             asyncio.create_task(self.heartbeat_loop())
 
             await self.send_status_notification(self.status)
+            asyncio.create_task(self.command_poll_loop())  # must start before the listener, which runs until disconnect
             await self.message_listener()
-
-            asyncio.create_task(self.command_poll_loop())   
-            asyncio.create_task(self.read_loop())    
             
         except Exception as e:
             self.logger.error(f'Connection error: {e}')
@@ -95,10 +106,21 @@ class Client:
             if message_type == 3:  # CALLRESULT
                 payload = message[2] if len(message) > 2 else {}  
                 self.logger.info(f"Response received: {payload}")
+                action = self.pending_calls.pop(message[1], None)
+                if action == "StartTransaction" and payload.get("transactionId") is not None:
+                    self.transaction_id = payload["transactionId"]
+                    if self.meter_task is not None:
+                        self.meter_task.cancel()  # loop of a previous transaction may still be sleeping
+                    self.meter_task = asyncio.create_task(self.meter_values_loop())
                 if payload.get("status") == "Accepted" and payload.get("interval"):
                     self.heartbeat_interval = payload["interval"]
                 elif payload.get("statyus") == "Accepted" and payload.get("interval"):  # Backup for server typo
                     self.heartbeat_interval = payload["interval"]
+            elif message_type == 4:  # CALLERROR, server rejected our message
+                self.pending_calls.pop(message[1], None)
+                error_code = message[2] if len(message) > 2 else None
+                description = message[3] if len(message) > 3 else ""
+                self.logger.error(f"CallError received: {error_code} {description}")
         except Exception as e:
             self.logger.error(f"Error handling message: {e}")
 
@@ -108,18 +130,21 @@ class Client:
         message_id = str(uuid.uuid4()) #universally unique indentifier(to create unique id)
         message = [2, message_id, action, payload]
         try:
+            self.pending_calls[message_id] = action
+            if self.trace:
+                message.append({"traceId": message_id, "stamps": {"client_send": time.monotonic_ns()}})
             await self.websocket.send(json.dumps(message))
             self.last_message_time = datetime.now()
             return message_id
         except Exception as e:
+            self.pending_calls.pop(message_id, None)
             self.logger.error(f"Failed to send {action}: {e}")
             return None
 
     async def send_boot_notification(self):
         if self.websocket is None or not self.connected:
             return None
-        boot_notification = {
-            "cpId": self.charge_point_id,
+        boot_notification = {  # charge point id travels in the websocket URL, not in the payload
             "chargePointVendor": "MyVendor",
             "chargePointModel": "MyModel",
             "chargePointSerialNumber": "1234567890",
@@ -147,14 +172,65 @@ class Client:
         self.status = status
         self.send_heartbeat_flag = (status == "Available")
         status_notification = {
-            "cpId": self.charge_point_id,
             "connectorId": 0,
+            "errorCode": "NoError",
             "status": status,
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
         await self.send_message("StatusNotification", status_notification)
         self.logger.info(f"StatusNotification: {status}")
 
+    async def send_start_transaction(self, id_tag="SIMULATOR"):
+        start_transaction = {
+            "connectorId": 1,
+            "idTag": id_tag,
+            "meterStart": int(self.meter_wh),
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        await self.send_message("StartTransaction", start_transaction)  # transactionId arrives in the CALLRESULT
+        self.logger.info("StartTransaction sent...")
+
+    async def send_stop_transaction(self, reason="Local"):
+        if self.transaction_id is None:
+            return
+        stop_transaction = {
+            "transactionId": self.transaction_id,
+            "meterStop": int(self.meter_wh),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "reason": reason
+        }
+        self.transaction_id = None  # stops meter_values_loop
+        await self.send_message("StopTransaction", stop_transaction)
+        self.logger.info("StopTransaction sent...")
+
+    async def send_meter_values(self):
+        meter_values = {
+            "connectorId": 1,
+            "transactionId": self.transaction_id,
+            "meterValue": [{
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "sampledValue": [
+                    {"value": str(int(self.meter_wh)), "measurand": "Energy.Active.Import.Register", "unit": "Wh"},
+                    {"value": str(int(self.power_w)), "measurand": "Power.Active.Import", "unit": "W"}
+                ]
+            }]
+        }
+        await self.send_message("MeterValues", meter_values)
+
+    async def meter_values_loop(self):  # emits samples every meter_interval seconds while Charging
+        while self.connected and self.transaction_id is not None:
+            try:
+                await asyncio.sleep(self.meter_interval)
+                if self.status == 'Charging' and self.transaction_id is not None:
+                    self.power_w = random.uniform(7000, 11000)  # simulated 7-11 kW charging power
+                    self.meter_wh += self.power_w * self.meter_interval / 3600
+                    await self.send_meter_values()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.logger.error(f"MeterValues error: {e}")
+                break
+
     async def heartbeat_loop(self):
         while self.connected:
             try:
@@ -179,6 +255,7 @@ class Client:
                             cmd = data.get("command")
                             if cmd:
                                 await self._handle_command(cmd)
+                await asyncio.sleep(1.5)
             except Exception as e:
                 logging.error(f"Command poll error: {e}")
                 await asyncio.sleep(1.5)
@@ -191,6 +268,10 @@ class Client:
             "finish": "Available"
         }
         new_status = status_map.get(cmd)
+        if cmd == "start" and self.transaction_id is None:
+            await self.send_start_transaction()
+        elif cmd == "finish":
+            await self.send_stop_transaction()
         if new_status:
             await self.send_status_notification(new_status)
 
@@ -0,0 +1,13 @@
+import pytest
+
+from backend import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # fresh sqlite db per test, get_db_connection() reads database.DB_PATH on every call
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "ocpp_logs.db"))
+    database.init_database()
+    conn = database.get_db_connection()
+    yield conn
+    conn.close()
@@ -0,0 +1,62 @@
+"""
+Small sampling profiler shared by the server and the backend.
+
+A background thread samples the stacks of all other threads every `interval`
+seconds and counts them in collapsed format ("outer;inner;leaf count"), which
+can be fed to flamegraph.pl or speedscope. Enable with OCPP_PROFILER=1:
+- server:  kill -USR1 <pid>   -> writes profile_server_<pid>_<time>.txt
+- backend: GET /api/profile?seconds=5
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def profiler_enabled():
+    return os.environ.get("OCPP_PROFILER") == "1"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def run(self, seconds):
+        # blocking, samples every other thread for `seconds`
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self.samples[self._collapse(frame)] += 1
+            self.sample_count += 1
+            time.sleep(self.interval)
+        return self
+
+    def start(self, seconds, on_done=None):
+        # non-blocking, on_done(profiler) is called from the sampling thread
+        def target():
+            self.run(seconds)
+            if on_done:
+                on_done(self)
+        thread = threading.Thread(target=target, name="sampling-profiler", daemon=True)
+        thread.start()
+        return thread
+
+    def hot_stacks(self, limit=50):
+        return self.samples.most_common(limit)
+
+    def collapsed(self, limit=None):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common(limit))
@@ -0,0 +1,166 @@
+"""
+Columnar buffer for MeterValues samples.
+
+Samples are kept per transaction in array-backed columns (timestamp, measurand, phase,
+location, unit, value) instead of one dict per sample, and drained in bulk to the REST
+API (/metervalues). Kilo units are normalised on the way in (kWh -> Wh, kW -> W, ...).
+Bodies whose POST failed are put back with requeue(), up to max_retained samples.
+"""
+from array import array
+from datetime import datetime
+from server.ocpp_schemas import MEASURANDS, PHASES, LOCATIONS, UNITS, OcppError, FORMATION_VIOLATION
+
+# enum values are stored in the buffer as their index (1 byte per sample), 0 = not given
+MEASURAND_INDEX = {name: i for i, name in enumerate(MEASURANDS)}
+PHASE_INDEX = {name: i + 1 for i, name in enumerate(PHASES)}
+LOCATION_INDEX = {name: i + 1 for i, name in enumerate(LOCATIONS)}
+UNIT_INDEX = {name: i + 1 for i, name in enumerate(UNITS)}
+DEFAULT_MEASURAND = "Energy.Active.Import.Register"  # OCPP default when measurand is omitted
+
+# unit -> (stored unit, factor)
+UNIT_NORMALISATION = {
+    "kWh": ("Wh", 1000.0),
+    "kvarh": ("varh", 1000.0),
+    "kW": ("W", 1000.0),
+    "kvar": ("var", 1000.0),
+    "kVA": ("VA", 1000.0),
+}
+
+
+def _name(names, index):  # inverse of the *_INDEX maps above, 0 -> None
+    return names[index - 1] if index else None
+
+
+def parse_meter_values(meter_values):
+    # OCPP meterValue list [{timestamp, sampledValue: [{value, measurand, phase, ...}]}] -> column lists
+    # raises OcppError(FormationViolation) so the charger gets a CALLERROR instead of a silent drop
+    timestamps, measurands, phases, locations, units, values = [], [], [], [], [], []
+    try:
+        for meter_value in meter_values:
+            try:
+                timestamp = datetime.fromisoformat(meter_value["timestamp"]).timestamp()
+            except ValueError:
+                raise OcppError(FORMATION_VIOLATION, f"Invalid timestamp {meter_value['timestamp']!r}")
+            for sampled in meter_value["sampledValue"]:
+                measurand = MEASURAND_INDEX.get(sampled.get("measurand", DEFAULT_MEASURAND))
+                if measurand is None:
+                    raise OcppError(FORMATION_VIOLATION, f"Invalid measurand {sampled.get('measurand')!r}")
+                if sampled.get("format") == "SignedData":  # we only keep raw numbers
+                    continue
+                try:
+                    value = float(sampled["value"])
+                except ValueError:
+                    raise OcppError(FORMATION_VIOLATION, f"Invalid sampled value {sampled['value']!r}")
+                unit = sampled.get("unit")
+                if unit in UNIT_NORMALISATION:
+                    unit, factor = UNIT_NORMALISATION[unit]
+                    value *= factor
+                timestamps.append(timestamp)
+                measurands.append(measurand)
+                phases.append(PHASE_INDEX.get(sampled.get("phase"), 0))
+                locations.append(LOCATION_INDEX.get(sampled.get("location"), 0))
+                units.append(UNIT_INDEX.get(unit, 0))
+                values.append(value)
+    except (KeyError, TypeError, AttributeError) as e:  # payload skipped schema validation (sampling)
+        raise OcppError(FORMATION_VIOLATION, f"Invalid meterValue: {e!r}")
+    return timestamps, measurands, phases, locations, units, values
+
+
+class TransactionColumns:
+    __slots__ = ("cp_id", "connector_id", "timestamps", "measurands", "phases", "locations", "units", "values")
+
+    def __init__(self, cp_id, connector_id):
+        self.cp_id = cp_id
+        self.connector_id = connector_id
+        self.timestamps = array("d")  # epoch seconds
+        self.measurands = array("B")  # index into MEASURANDS
+        self.phases = array("B")      # PHASE_INDEX, 0 = not given
+        self.locations = array("B")   # LOCATION_INDEX, 0 = not given
+        self.units = array("B")       # UNIT_INDEX after normalisation, 0 = not given
+        self.values = array("d")
+
+    def extend(self, rows):
+        timestamps, measurands, phases, locations, units, values = rows
+        self.timestamps.extend(timestamps)
+        self.measurands.extend(measurands)
+        self.phases.extend(phases)
+        self.locations.extend(locations)
+        self.units.extend(units)
+        self.values.extend(values)
+
+    def to_rest(self, transaction_id):
+        return {
+            "transactionId": transaction_id,
+            "cpId": self.cp_id,
+            "connectorId": self.connector_id,
+            "timestamp": self.timestamps.tolist(),
+            "measurand": [MEASURANDS[m] for m in self.measurands],
+            "phase": [_name(PHASES, p) for p in self.phases],
+            "location": [_name(LOCATIONS, l) for l in self.locations],
+            "unit": [_name(UNITS, u) for u in self.units],
+            "value": self.values.tolist(),
+        }
+
+
+class MeterValueBuffer:
+    def __init__(self, max_samples=50000, max_retained=None):
+        self.max_samples = max_samples  # flush early when this many samples are waiting
+        # while the REST API is down failed flushes are requeued, beyond this many samples they are dropped
+        self.max_retained = max_retained if max_retained is not None else 10 * max_samples
+        self.transactions = {}  # transactionId -> TransactionColumns
+        self.size = 0
+
+    def add(self, cp_id, connector_id, transaction_id, meter_values):
+        # parses the whole payload first (may raise OcppError) and only then appends, so a bad
+        # sample never leaves half a message in the columns
+        # returns number of buffered samples (samples without a transaction are not stored)
+        rows = parse_meter_values(meter_values)
+        if transaction_id is None:
+            return 0
+        columns = self.transactions.get(transaction_id)
+        if columns is None:
+            columns = self.transactions[transaction_id] = TransactionColumns(cp_id, connector_id)
+        columns.extend(rows)
+        added = len(rows[-1])
+        self.size += added
+        return added
+
+    def is_full(self):
+        return self.size >= self.max_samples
+
+    def drain(self, transaction_id=None):
+        # removes buffered samples (all, or a single transaction) and returns them as REST bodies
+        if transaction_id is not None:
+            columns = self.transactions.pop(transaction_id, None)
+            drained = {transaction_id: columns} if columns else {}
+        else:
+            drained, self.transactions = self.transactions, {}
+        result = []
+        for tid, columns in drained.items():
+            self.size -= len(columns.values)
+            if len(columns.values):
+                result.append(columns.to_rest(tid))
+        return result
+
+    def requeue(self, transactions):
+        # puts REST bodies from drain() back after a failed POST, returns number of dropped samples
+        dropped = 0
+        for t in transactions:
+            count = len(t["value"])
+            if self.size + count > self.max_retained:
+                dropped += count
+                continue
+            tid = t["transactionId"]
+            columns = self.transactions.get(tid)
+            if columns is None:
+                columns = self.transactions[tid] = TransactionColumns(t["cpId"], t["connectorId"])
+            columns.extend((
+                t["timestamp"],
+                [MEASURAND_INDEX[m] for m in t["measurand"]],
+                [PHASE_INDEX.get(p, 0) for p in t["phase"]],
+                [LOCATION_INDEX.get(l, 0) for l in t["location"]],
+                [UNIT_INDEX.get(u, 0) for u in t["unit"]],
+                t["value"],
+            ))
+            self.size += count
+        return dropped
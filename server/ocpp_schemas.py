@@ -0,0 +1,313 @@
+"""
+OCPP 1.6-J payload schemas and precompiled validators.
+
+Schemas follow the official OCPP 1.6 JSON schemas (only the keywords they use:
+type, required, properties, additionalProperties, maxLength, enum, minimum, maximum, items).
+Every schema is compiled once at import into a chain of small closures, so
+validating a message is a few dict lookups / isinstance checks instead of a full
+generic jsonschema walk.
+"""
+
+# OCPP 1.6 CALLERROR codes used by the validator
+PROTOCOL_ERROR = "ProtocolError"
+FORMATION_VIOLATION = "FormationViolation"
+PROPERTY_CONSTRAINT_VIOLATION = "PropertyConstraintViolation"
+OCCURENCE_CONSTRAINT_VIOLATION = "OccurenceConstraintViolation"  # (sic) spelling from the OCPP 1.6 spec
+TYPE_CONSTRAINT_VIOLATION = "TypeConstraintViolation"
+NOT_IMPLEMENTED = "NotImplemented"
+INTERNAL_ERROR = "InternalError"
+
+MAX_TRANSACTION_ID = 2**31 - 1  # many OCPP 1.6 firmwares store transactionId as a signed 32-bit integer
+
+
+class OcppError(Exception):
+    # raised for invalid frames/payloads, turned into a CALLERROR by the server
+    def __init__(self, code, description, message_id=None):
+        super().__init__(f"{code}: {description}")
+        self.code = code
+        self.description = description
+        self.message_id = message_id
+
+    def to_call_error(self):  # [4, messageId, errorCode, errorDescription, errorDetails]
+        return [4, self.message_id if self.message_id is not None else "-1", self.code, self.description, {}]
+
+
+CHARGE_POINT_ERROR_CODES = [
+    "ConnectorLockFailure", "EVCommunicationError", "GroundFailure", "HighTemperature",
+    "InternalError", "LocalListConflict", "NoError", "OtherError", "OverCurrentFailure",
+    "PowerMeterFailure", "PowerSwitchFailure", "ReaderFailure", "ResetFailure",
+    "UnderVoltage", "OverVoltage", "WeakSignal",
+]
+
+CHARGE_POINT_STATUSES = [
+    "Available", "Preparing", "Charging", "SuspendedEVSE", "SuspendedEV",
+    "Finishing", "Reserved", "Unavailable", "Faulted",
+]
+
+READING_CONTEXTS = [
+    "Interruption.Begin", "Interruption.End", "Sample.Clock", "Sample.Periodic",
+    "Transaction.Begin", "Transaction.End", "Trigger", "Other",
+]
+
+MEASURANDS = [
+    "Energy.Active.Export.Register", "Energy.Active.Import.Register",
+    "Energy.Reactive.Export.Register", "Energy.Reactive.Import.Register",
+    "Energy.Active.Export.Interval", "Energy.Active.Import.Interval",
+    "Energy.Reactive.Export.Interval", "Energy.Reactive.Import.Interval",
+    "Power.Active.Export", "Power.Active.Import", "Power.Offered",
+    "Power.Reactive.Export", "Power.Reactive.Import", "Power.Factor",
+    "Current.Import", "Current.Export", "Current.Offered",
+    "Voltage", "Frequency", "Temperature", "SoC", "RPM",
+]
+
+PHASES = ["L1", "L2", "L3", "N", "L1-N", "L2-N", "L3-N", "L1-L2", "L2-L3", "L3-L1"]
+
+LOCATIONS = ["Cable", "EV", "Inlet", "Outlet", "Body"]
+
+UNITS = [
+    "Wh", "kWh", "varh", "kvarh", "W", "kW", "VA", "kVA", "var", "kvar",
+    "A", "V", "K", "Celcius", "Celsius", "Fahrenheit", "Percent",
+]
+
+STOP_REASONS = [
+    "EmergencyStop", "EVDisconnected", "HardReset", "Local", "Other", "PowerLoss",
+    "Reboot", "Remote", "SoftReset", "UnlockCommand", "DeAuthorized",
+]
+
+# MeterValue type shared by MeterValues.req and StopTransaction.req (transactionData)
+METER_VALUE = {
+    "type": "object",
+    "properties": {
+        "timestamp": {"type": "string"},  # date-time
+        "sampledValue": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "value":     {"type": "string"},
+                    "context":   {"type": "string", "enum": READING_CONTEXTS},
+                    "format":    {"type": "string", "enum": ["Raw", "SignedData"]},
+                    "measurand": {"type": "string", "enum": MEASURANDS},
+                    "phase":     {"type": "string", "enum": PHASES},
+                    "location":  {"type": "string", "enum": LOCATIONS},
+                    "unit":      {"type": "string", "enum": UNITS},
+                },
+                "additionalProperties": False,
+                "required": ["value"],
+            },
+        },
+    },
+    "additionalProperties": False,
+    "required": ["timestamp", "sampledValue"],
+}
+
+SCHEMAS = {
+    "BootNotification": {
+        "type": "object",
+        "properties": {
+            "chargePointVendor":       {"type": "string", "maxLength": 20},
+            "chargePointModel":        {"type": "string", "maxLength": 20},
+            "chargePointSerialNumber": {"type": "string", "maxLength": 25},
+            "chargeBoxSerialNumber":   {"type": "string", "maxLength": 25},
+            "firmwareVersion":         {"type": "string", "maxLength": 50},
+            "iccid":                   {"type": "string", "maxLength": 20},
+            "imsi":                    {"type": "string", "maxLength": 20},
+            "meterType":               {"type": "string", "maxLength": 25},
+            "meterSerialNumber":       {"type": "string", "maxLength": 25},
+        },
+        "additionalProperties": False,
+        "required": ["chargePointVendor", "chargePointModel"],
+    },
+    "Heartbeat": {
+        "type": "object",
+        "properties": {},
+        "additionalProperties": False,
+    },
+    "StatusNotification": {
+        "type": "object",
+        "properties": {
+            "connectorId":     {"type": "integer", "minimum": 0},
+            "errorCode":       {"type": "string", "enum": CHARGE_POINT_ERROR_CODES},
+            "info":            {"type": "string", "maxLength": 50},
+            "status":          {"type": "string", "enum": CHARGE_POINT_STATUSES},
+            "timestamp":       {"type": "string"},  # date-time
+            "vendorId":        {"type": "string", "maxLength": 255},
+            "vendorErrorCode": {"type": "string", "maxLength": 50},
+        },
+        "additionalProperties": False,
+        "required": ["connectorId", "errorCode", "status"],
+    },
+    "StartTransaction": {
+        "type": "object",
+        "properties": {
+            "connectorId":   {"type": "integer", "minimum": 1},
+            "idTag":         {"type": "string", "maxLength": 20},
+            "meterStart":    {"type": "integer"},
+            "reservationId": {"type": "integer"},
+            "timestamp":     {"type": "string"},  # date-time
+        },
+        "additionalProperties": False,
+        "required": ["connectorId", "idTag", "meterStart", "timestamp"],
+    },
+    "StopTransaction": {
+        "type": "object",
+        "properties": {
+            "idTag":           {"type": "string", "maxLength": 20},
+            "meterStop":       {"type": "integer"},
+            "timestamp":       {"type": "string"},  # date-time
+            "transactionId":   {"type": "integer", "maximum": MAX_TRANSACTION_ID},
+            "reason":          {"type": "string", "enum": STOP_REASONS},
+            "transactionData": {"type": "array", "items": METER_VALUE},
+        },
+        "additionalProperties": False,
+        "required": ["transactionId", "timestamp", "meterStop"],
+    },
+    "MeterValues": {
+        "type": "object",
+        "properties": {
+            "connectorId":   {"type": "integer", "minimum": 0},
+            "transactionId": {"type": "integer", "maximum": MAX_TRANSACTION_ID},
+            "meterValue":    {"type": "array", "items": METER_VALUE},
+        },
+        "additionalProperties": False,
+        "required": ["connectorId", "meterValue"],
+    },
+}
+
+
+def _check_type(expected):
+    # bool is a subclass of int in python, json booleans must not pass as numbers
+    if expected == "string":
+        return lambda v: isinstance(v, str)
+    if expected == "integer":
+        return lambda v: isinstance(v, int) and not isinstance(v, bool)
+    if expected == "number":
+        return lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)
+    if expected == "boolean":
+        return lambda v: isinstance(v, bool)
+    if expected == "object":
+        return lambda v: isinstance(v, dict)
+    if expected == "array":
+        return lambda v: isinstance(v, list)
+    raise ValueError(f"unsupported schema type: {expected}")
+
+
+def compile_schema(schema, path="payload"):
+    # turns a schema dict into a single validate(value) function (raises OcppError)
+    checks = []
+
+    expected = schema.get("type")
+    if expected:
+        is_type = _check_type(expected)
+
+        def check_type(value):
+            if not is_type(value):
+                raise OcppError(TYPE_CONSTRAINT_VIOLATION, f"{path} must be of type {expected}")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+
+        def check_enum(value):
+            if value not in allowed:
+                raise OcppError(PROPERTY_CONSTRAINT_VIOLATION, f"{path} has invalid value {value!r}")
+        checks.append(check_enum)
+
+    if "maxLength" in schema:
+        max_length = schema["maxLength"]
+
+        def check_max_length(value):
+            if len(value) > max_length:
+                raise OcppError(PROPERTY_CONSTRAINT_VIOLATION, f"{path} exceeds maxLength {max_length}")
+        checks.append(check_max_length)
+
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+
+        def check_minimum(value):
+            if value < minimum:
+                raise OcppError(PROPERTY_CONSTRAINT_VIOLATION, f"{path} is below minimum {minimum}")
+        checks.append(check_minimum)
+
+    if "maximum" in schema:
+        maximum = schema["maximum"]
+
+        def check_maximum(value):
+            if value > maximum:
+                raise OcppError(PROPERTY_CONSTRAINT_VIOLATION, f"{path} is above maximum {maximum}")
+        checks.append(check_maximum)
+
+    if "required" in schema:
+        required = tuple(schema["required"])
+
+        def check_required(value):
+            for key in required:
+                if key not in value:
+                    raise OcppError(OCCURENCE_CONSTRAINT_VIOLATION, f"{path}.{key} is required")
+        checks.append(check_required)
+
+    if "properties" in schema:
+        properties = {key: compile_schema(sub, f"{path}.{key}") for key, sub in schema["properties"].items()}
+        allow_extra = schema.get("additionalProperties", True)
+
+        def check_properties(value):
+            for key, item in value.items():
+                validate_item = properties.get(key)
+                if validate_item is not None:
+                    validate_item(item)
+                elif not allow_extra:
+                    raise OcppError(FORMATION_VIOLATION, f"{path}.{key} is not allowed")
+        checks.append(check_properties)
+
+    if "items" in schema:
+        validate_item = compile_schema(schema["items"], f"{path}[]")
+
+        def check_items(value):
+            for item in value:
+                validate_item(item)
+        checks.append(check_items)
+
+    checks = tuple(checks)
+
+    def validate(value):
+        for check in checks:
+            check(value)
+    return validate
+
+
+# compiled once at startup, one validator per supported action
+VALIDATORS = {action: compile_schema(schema) for action, schema in SCHEMAS.items()}
+
+
+def parse_call(message):
+    # checks the CALL frame structure: [2, "<messageId>", "<action>", {payload}] (+ optional {trace})
+    if not isinstance(message, list) or len(message) < 3:
+        raise OcppError(PROTOCOL_ERROR, "Frame must be a JSON array with at least 3 elements")
+    message_id = message[1] if isinstance(message[1], str) else None
+    if message_id is None:
+        raise OcppError(PROTOCOL_ERROR, "Message id must be a string")
+    if message[0] != 2:
+        raise OcppError(PROTOCOL_ERROR, f"Unsupported message type {message[0]!r}", message_id)
+    # optional 5th element is trace metadata, only sent by simulator clients with OCPP_TRACE=1
+    if len(message) != 4 and not (len(message) == 5 and isinstance(message[4], dict)):
+        raise OcppError(PROTOCOL_ERROR, "CALL frame must have exactly 4 elements", message_id)
+    action = message[2]
+    if not isinstance(action, str):
+        raise OcppError(PROTOCOL_ERROR, "Action must be a string", message_id)
+    payload = message[3]
+    if not isinstance(payload, dict):
+        raise OcppError(FORMATION_VIOLATION, "Payload must be a JSON object", message_id)
+    return message_id, action, payload
+
+
+def validate_payload(action, payload, message_id=None, full=True):
+    # full=False only checks that the action is supported (used when sampling)
+    validator = VALIDATORS.get(action)
+    if validator is None:
+        raise OcppError(NOT_IMPLEMENTED, f"Action {action} is not supported", message_id)
+    if full:
+        try:
+            validator(payload)
+        except OcppError as e:
+            e.message_id = message_id
+            raise
@@ -8,8 +8,21 @@ import ssl
 # libraries for REST API 
 import aiohttp  # for sending asynchronous HTTP requests to REST API
 import os
+import random
+import itertools
+import time
+import signal
 from collections import OrderedDict
 import sqlite3
+import sys
+if __package__ in (None, ''):  # started as `python server/ocpp_server.py`, make the repo root importable
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from server.ocpp_schemas import (OcppError, INTERNAL_ERROR, PROTOCOL_ERROR, PROPERTY_CONSTRAINT_VIOLATION,
+                                 MAX_TRANSACTION_ID, parse_call, validate_payload)
+from server.meter_buffer import MeterValueBuffer
+from profiler import SamplingProfiler, profiler_enabled
+
+TRANSACTION_ID_EPOCH = 1577836800  # 2020-01-01, fallback ids are seconds since then and fit in int32 until ~2088
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,35 +31,65 @@ logging.basicConfig(
 
 
 class Server:
-    def __init__(self, host='localhost', port=8080, use_ssl='True'):
+    def __init__(self, host='localhost', port=8080, use_ssl='True', validation_sample_rate=None):
         self.host = host
         self.port = port
         self.use_ssl = use_ssl
         self.logger = logging.getLogger('Server')
         self.connections = {}
         self.rest_base = os.environ.get('REST_API_BASE', 'http://localhost:3000')  # REST API base URL (Flask)
+        # fraction of CALL payloads validated against the schema (1.0 = all, lower it under heavy load)
+        # frame structure and action support are always checked, only the schema walk is sampled
+        if validation_sample_rate is None:
+            validation_sample_rate = float(os.environ.get('OCPP_VALIDATION_SAMPLE_RATE', '1.0'))
+        self.validation_sample_rate = validation_sample_rate
+        # reseeded from the backend in start() so ids stay unique across server restarts
+        self.transaction_ids = itertools.count(int(time.time()) - TRANSACTION_ID_EPOCH)
+        self.transactions = {}  # open transactions, transactionId -> {cpId, connectorId, idTag}
+        # MeterValues are buffered per transaction and sent to REST in bulk every meter_flush_interval seconds
+        self.meter_buffer = MeterValueBuffer(max_samples=int(os.environ.get('METER_BUFFER_MAX_SAMPLES', '50000')))
+        self.meter_flush_interval = float(os.environ.get('METER_FLUSH_INTERVAL', '1.0'))
+        self.meter_flush_task = None  # early flush started by a full buffer, at most one at a time
+        # OCPP_TRACE=1: frames carrying trace metadata are stamped here and forwarded to REST in X-Trace-* headers
+        self.trace = os.environ.get('OCPP_TRACE') == '1'
+
+    def _should_validate(self):
+        rate = self.validation_sample_rate
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
 
-    async def _post_to_rest(self, endpoint: str, payload: dict):  # send POST request to REST API
+    async def _post_to_rest(self, endpoint: str, payload: dict, log_payload=True, trace=None):  # send POST request to REST API, returns True on success
         url = f"{self.rest_base.rstrip('/')}/{endpoint.lstrip('/')}"  # remove trailing/leading slashes
         try:
             timeout = aiohttp.ClientTimeout(total=5)  # set timeout to 5 seconds
             async with aiohttp.ClientSession(timeout=timeout) as session:
                 # log payload (can be removed later)
-                self.logger.info(f'[REST]-> {endpoint} payload: {json.dumps(payload, ensure_ascii=False)}')
+                if log_payload:
+                    self.logger.info(f'[REST]-> {endpoint} payload: {json.dumps(payload, ensure_ascii=False)}')
 
-                async with session.post(url, json=payload) as response:  # payload is automatically converted to JSON
+                headers = None
+                if trace is not None:
+                    trace['stamps']['rest_sent'] = time.monotonic_ns()
+                    headers = {
+                        'X-Trace-Id': trace['traceId'],
+                        'X-Trace-Stamps': ','.join(f'{stage}={ns}' for stage, ns in trace['stamps'].items()),
+                    }
+                async with session.post(url, json=payload, headers=headers) as response:  # payload is automatically converted to JSON
                     text = await response.text()  # read response from server
                     if response.status >= 400:
                         self.logger.error(f'Restapi error: [REST]{endpoint}-> {response.status}{text}')
-                    else:
-                        self.logger.info(f'[REST] OK {endpoint}-> {response.status}')
+                        return False
+                    self.logger.info(f'[REST] OK {endpoint}-> {response.status}')
+                    return True
 
         except Exception as e:
             self.logger.error(f'[REST] POST {endpoint} failed {e}')
+            return False
 
-    async def _log_action_to_rest(self, cp_id: str, action: str, payload: dict):
+    async def _log_action_to_rest(self, cp_id: str, action: str, payload: dict, response: dict = None, trace=None):
         # When sending to REST without touching OCPP schema, cpID is added at the beginning
         # Every endpoint receives JSON that starts with cpID (using OrderedDict)
+        if trace is not None:
+            trace['stamps']['rest_dequeued'] = time.monotonic_ns()  # time spent waiting as a pending task
 
         if action == 'BootNotification':
             body = OrderedDict([
@@ -61,7 +104,7 @@ class Server:
                 ("meterType",               payload.get("meterType")),
                 ("meterSerialNumber",       payload.get("meterSerialNumber")),
             ])
-            await self._post_to_rest('/bootnotification', body)
+            await self._post_to_rest('/bootnotification', body, trace=trace)
 
             # This is the first connection message where the charging station introduces itself
 
@@ -70,7 +113,7 @@ class Server:
                 ('cpId', cp_id),
                 ('currentTime', payload.get("currentTime")),
             ])
-            await self._post_to_rest('/heartbeat', body)
+            await self._post_to_rest('/heartbeat', body, trace=trace)
 
         elif action == 'StatusNotification':
             body = OrderedDict([
@@ -83,10 +126,119 @@ class Server:
                 ('vendorId', payload.get("vendorId")),
                 ('vendorErrorCode', payload.get("vendorErrorCode")),
             ])
-            await self._post_to_rest('/statusnotification', body)
+            await self._post_to_rest('/statusnotification', body, trace=trace)
+
+        elif action == 'StartTransaction':
+            body = OrderedDict([
+                ('cpId', cp_id),
+                ('transactionId', (response or {}).get("transactionId")),  # assigned by process_call
+                ('connectorId', payload.get("connectorId")),
+                ('idTag', payload.get("idTag")),
+                ('meterStart', payload.get("meterStart")),
+                ('timestamp', payload.get("timestamp")),
+            ])
+            await self._post_to_rest('/starttransaction', body, trace=trace)
+
+        elif action == 'StopTransaction':
+            transaction_id = payload.get("transactionId")
+            # remaining samples of this transaction (incl. transactionData, buffered in handle_message)
+            # go out before the stop record, a failed flush must not keep the transaction open
+            try:
+                await self._flush_meter_values(transaction_id)
+            except Exception as e:
+                self.logger.error(f'MeterValues flush error for transaction {transaction_id}: {e}')
+            body = OrderedDict([
+                ('cpId', cp_id),
+                ('transactionId', transaction_id),
+                ('idTag', payload.get("idTag")),
+                ('meterStop', payload.get("meterStop")),
+                ('timestamp', payload.get("timestamp")),
+                ('reason', payload.get("reason")),
+            ])
+            await self._post_to_rest('/stoptransaction', body, trace=trace)
 
         else:
-            self.logger.debug(f'[REST] unknown action {action}')  # if not one of the 3 supported messages, do not send to REST
+            self.logger.debug(f'[REST] unknown action {action}')  # if not one of the supported messages, do not send to REST
+
+    async def _init_transaction_ids(self):
+        # continue after the highest id the backend has stored, fall back to the clock if it is not reachable
+        url = f"{self.rest_base.rstrip('/')}/api/transactions/next_id"
+        try:
+            timeout = aiohttp.ClientTimeout(total=5)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    seed = int((await response.json())["nextId"])
+        except Exception as e:
+            seed = int(time.time()) - TRANSACTION_ID_EPOCH
+            self.logger.warning(f'Transaction ids seeded from clock ({seed}), backend not reachable: {e}')
+        self.transaction_ids = itertools.count(seed)
+        self.logger.info(f'Next transaction id: {seed}')
+
+    def _buffer_meter_values(self, cp_id: str, action: str, payload: dict, message_id: str):
+        # MeterValues (and StopTransaction.transactionData) are not posted one by one, they are collected
+        # in columnar buffers; called before the reply so bad samples are answered with a CALLERROR
+        transaction_id = payload.get("transactionId")
+        # only samples of transactions this server started are kept (type check: payload may be unvalidated)
+        known = type(transaction_id) is int and transaction_id in self.transactions
+        try:
+            if action == 'MeterValues':
+                if transaction_id is not None and not known:
+                    raise OcppError(PROPERTY_CONSTRAINT_VIOLATION, f'Unknown transactionId {transaction_id!r}')
+                self.meter_buffer.add(cp_id, payload.get("connectorId"), transaction_id, payload.get("meterValue"))
+            else:
+                # a stop for an unknown transaction is still accepted, its transactionData is checked but not stored
+                self.meter_buffer.add(cp_id, None, transaction_id if known else None, payload.get("transactionData", []))
+        except OcppError as e:
+            e.message_id = message_id
+            raise
+        if self.meter_buffer.is_full() and (self.meter_flush_task is None or self.meter_flush_task.done()):
+            self.meter_flush_task = asyncio.create_task(self._flush_meter_values())
+
+    async def _flush_meter_values(self, transaction_id=None):
+        transactions = self.meter_buffer.drain(transaction_id)
+        if transactions:
+            samples = sum(len(t["value"]) for t in transactions)
+            self.logger.info(f'[REST]-> /metervalues {samples} samples in {len(transactions)} transactions')
+            if not await self._post_to_rest('/metervalues', {"transactions": transactions}, log_payload=False):
+                # keep them for the next flush, the backend ignores samples it already stored
+                dropped = self.meter_buffer.requeue(transactions)
+                if dropped:
+                    self.logger.error(f'MeterValues buffer over {self.meter_buffer.max_retained} samples, dropped {dropped}')
+
+    def _frame_trace(self, message, received_ns):
+        # trace metadata from the optional 5th frame element: {"traceId": ..., "stamps": {"client_send": ns}}
+        if not self.trace or len(message) < 5:
+            return None
+        meta = message[4]
+        stamps = meta.get('stamps')
+        if not isinstance(meta.get('traceId'), str) or not isinstance(stamps, dict):
+            return None
+        stamps = {stage: ns for stage, ns in stamps.items() if stage.isidentifier() and type(ns) is int}  # ends up in a header
+        stamps['server_recv'] = received_ns
+        return {'traceId': meta['traceId'], 'stamps': stamps}
+
+    def _dump_profile(self):  # SIGUSR1 handler, samples the server for OCPP_PROFILE_SECONDS and writes hot stacks
+        seconds = float(os.environ.get('OCPP_PROFILE_SECONDS', '10'))
+        path = f'profile_server_{os.getpid()}_{int(time.time())}.txt'
+
+        def write(sampler):
+            with open(path, 'w') as f:
+                f.write(sampler.collapsed())
+            self.logger.info(f'[PROFILE] {sampler.sample_count} samples written to {path}')
+            for stack, count in sampler.hot_stacks(5):
+                self.logger.info(f'[PROFILE] {count} ...;{";".join(stack.split(";")[-3:])}')
+
+        self.logger.info(f'[PROFILE] sampling server for {seconds}s')
+        SamplingProfiler().start(seconds, on_done=write)
+
+    async def meter_flush_loop(self):
+        while True:
+            await asyncio.sleep(self.meter_flush_interval)
+            try:
+                await self._flush_meter_values()
+            except Exception as e:
+                self.logger.error(f'MeterValues flush error: {e}')
 
     async def start(self):
         protocol = 'wss' if self.use_ssl else 'ws'
@@ -111,6 +263,14 @@ class Server:
             ssl=ssl_context
         ):
             self.logger.info(f'Server started: {protocol}://{self.host}:{self.port}')
+            await self._init_transaction_ids()
+            asyncio.create_task(self.meter_flush_loop())
+            if profiler_enabled():
+                if hasattr(signal, 'SIGUSR1'):  # not available on Windows
+                    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self._dump_profile)
+                    self.logger.info(f'Profiler enabled: kill -USR1 {os.getpid()} dumps hot stacks')
+                else:
+                    self.logger.info('Profiler: no SIGUSR1 on this platform, only the backend /api/profile is available')
             await asyncio.Future()
 
     async def handle_client(self, websocket, path):  # the URL path used by the client
@@ -136,29 +296,52 @@ class Server:
             self.connections.pop(charge_point_id, None)  # remove client when disconnected (None prevents KeyError)
 
     async def handle_message(self, websocket, charge_point_id, raw_message):
+        received_ns = time.monotonic_ns()
         try:
-            message = json.loads(raw_message)
-            # OCPP messages always have 4 elements
-            message_type = message[0]  # type of OCPP message
-            message_id = message[1]    # ID of OCPP message
-            action = message[2]        # action of OCPP message
-            payload = message[3] if len(message) > 3 else {}  # payload of OCPP message (safe parsing)
-            # len check: OCPP message must have min 3 elements, payload is optional
-            self.logger.info(f"[{charge_point_id}] Received {action}: {payload}")
-
-            if message_type == 2:  # CALL
-                response = await self.process_call(action, payload)
-                response_message = [3, message_id, response]
-
-                await websocket.send(json.dumps(response_message))
-                self.logger.info(f"[{charge_point_id}] processed {action}: {payload}")
+            try:
+                message = json.loads(raw_message)
+            except ValueError:
+                raise OcppError(PROTOCOL_ERROR, 'Frame is not valid JSON')
+
+            if isinstance(message, list) and message and message[0] in (3, 4):  # CALLRESULT / CALLERROR from client
+                self.logger.debug(f"[{charge_point_id}] Received response frame: {message}")
+                return
+
+            # OCPP CALL: [2, messageId, action, payload], invalid frames are answered with a CALLERROR
+            message_id, action, payload = parse_call(message)
+            validate_payload(action, payload, message_id, full=self._should_validate())
+            trace = self._frame_trace(message, received_ns)
+            if action in ('MeterValues', 'StopTransaction'):
+                self._buffer_meter_values(charge_point_id, action, payload, message_id)
+            # MeterValues are the highest-volume message (1/s per connector), only logged at DEBUG
+            log = self.logger.debug if action == 'MeterValues' else self.logger.info
+            log(f"[{charge_point_id}] Received {action}: {payload}")
+
+            try:
+                response = await self.process_call(charge_point_id, action, payload)
+            except Exception as e:
+                self.logger.error(f'[{charge_point_id}] {action} processing error: {e}')
+                raise OcppError(INTERNAL_ERROR, f'Error while processing {action}', message_id)
+            response_message = [3, message_id, response]
+
+            await websocket.send(json.dumps(response_message))
+            if trace is not None:
+                trace['stamps']['server_replied'] = time.monotonic_ns()
+            log(f"[{charge_point_id}] processed {action}: {payload}")
+            if action != 'MeterValues':  # MeterValues are flushed in bulk, so their traces end here
                 # send to REST API asynchronously
-                asyncio.create_task(self._log_action_to_rest(charge_point_id, action, payload))
+                asyncio.create_task(self._log_action_to_rest(charge_point_id, action, payload, response, trace))
 
+        except OcppError as e:
+            self.logger.warning(f'[{charge_point_id}] Rejected frame: {e}')
+            try:
+                await websocket.send(json.dumps(e.to_call_error()))
+            except Exception as send_error:
+                self.logger.error(f'CALLERROR send failed: {charge_point_id} - {send_error}')
         except Exception as e:
             self.logger.error(f'Message processing error: {charge_point_id} - {e}')
 
-    async def process_call(self, action, payload):  # takes a CALL and returns a CALLRESULT
+    async def process_call(self, charge_point_id, action, payload):  # takes a CALL and returns a CALLRESULT
         if action == 'BootNotification':
             return {
                 'status': 'Accepted',
@@ -171,8 +354,28 @@ class Server:
             }
         elif action == 'StatusNotification':  # empty response is enough, just acknowledgment
             return {}
+        elif action == 'StartTransaction':
+            transaction_id = next(self.transaction_ids)
+            if transaction_id > MAX_TRANSACTION_ID:  # wrap around instead of sending an id the charger can not store
+                self.logger.warning('Transaction ids exhausted int32 range, restarting at 1')
+                self.transaction_ids = itertools.count(1)
+                transaction_id = next(self.transaction_ids)
+            self.transactions[transaction_id] = {
+                'cpId': charge_point_id,
+                'connectorId': payload.get('connectorId'),
+                'idTag': payload.get('idTag'),
+            }
+            return {
+                'transactionId': transaction_id,
+                'idTagInfo': {'status': 'Accepted'}  # no authorization list in the simulator, every idTag is accepted
+            }
+        elif action == 'StopTransaction':
+            self.transactions.pop(payload.get('transactionId'), None)
+            return {'idTagInfo': {'status': 'Accepted'}}
+        elif action == 'MeterValues':  # samples are already buffered, empty response is enough
+            return {}
         else:
-            self.logger.warning(f'Unknown action: {action}')  # if client sends unsupported action
+            self.logger.warning(f'Unknown action: {action}')  # unsupported actions are rejected by validate_payload
             return {}  # prevents crashing
 
 async def main():
@@ -0,0 +1,63 @@
+from datetime import datetime, date
+
+from backend.analytics import split_by_day, record_status_change, get_analytics
+
+
+def add_charge_point(conn, cp_id, status, since):
+    conn.execute("INSERT INTO charge_points (cp_id, status, status_since) VALUES (?,?,?)",
+                 (cp_id, status, since.isoformat()))
+    conn.commit()
+
+
+def test_split_by_day_crosses_midnight():
+    parts = list(split_by_day(datetime(2025, 8, 18, 22, 0), datetime(2025, 8, 19, 2, 30)))
+    assert parts == [("2025-08-18", 7200.0), ("2025-08-19", 9000.0)]
+
+
+def test_split_by_day_empty_interval():
+    assert list(split_by_day(datetime(2025, 8, 19, 1), datetime(2025, 8, 19, 1))) == []
+
+
+def test_status_change_after_midnight_books_both_days(db):
+    add_charge_point(db, "A", "Available", datetime(2025, 8, 18, 22, 0))
+    record_status_change(db, "A", "Charging", datetime(2025, 8, 19, 1, 0))
+    db.commit()
+
+    per_cp = db.execute("SELECT day, status, seconds FROM status_durations WHERE cp_id='A' ORDER BY day").fetchall()
+    assert [tuple(r) for r in per_cp] == [("2025-08-18", "Available", 7200.0), ("2025-08-19", "Available", 3600.0)]
+    fleet = db.execute("SELECT day, status, seconds FROM fleet_status_durations ORDER BY day").fetchall()
+    assert [tuple(r) for r in fleet] == [("2025-08-18", "Available", 7200.0), ("2025-08-19", "Available", 3600.0)]
+    cp = db.execute("SELECT status, status_since FROM charge_points WHERE cp_id='A'").fetchone()
+    assert (cp["status"], cp["status_since"]) == ("Charging", "2025-08-19T01:00:00")
+
+
+def test_range_ending_before_today_includes_open_interval_up_to_range_end(db):
+    add_charge_point(db, "A", "Charging", datetime(2025, 8, 17, 20, 0))  # still charging, never closed
+
+    result = get_analytics(db, date(2025, 8, 17), date(2025, 8, 18), now=datetime(2025, 8, 19, 10, 0))
+
+    assert result["charge_points"]["A"]["days"] == {
+        "2025-08-17": {"Charging": 14400.0},
+        "2025-08-18": {"Charging": 86400.0},  # nothing from 2025-08-19, it is outside the range
+    }
+    assert result["fleet"]["durations"] == {"Charging": 100800.0}
+    assert result["fleet"]["utilisation_pct"] == 100.0
+
+
+def test_fleet_totals_match_charge_points_and_cp_filter(db):
+    add_charge_point(db, "A", "Available", datetime(2025, 8, 19, 0, 0))
+    add_charge_point(db, "B", "Available", datetime(2025, 8, 19, 12, 0))
+    record_status_change(db, "A", "Charging", datetime(2025, 8, 19, 6, 0))
+    db.commit()
+    now = datetime(2025, 8, 19, 18, 0)
+
+    result = get_analytics(db, date(2025, 8, 19), date(2025, 8, 19), now=now)
+    assert result["charge_points"]["A"]["durations"] == {"Available": 21600.0, "Charging": 43200.0}
+    assert result["charge_points"]["B"]["durations"] == {"Available": 21600.0}
+    assert result["fleet"]["durations"] == {"Available": 43200.0, "Charging": 43200.0}
+    assert result["fleet"]["utilisation_pct"] == 50.0
+    assert result["fleet"]["availability_pct"] == 100.0
+
+    only_b = get_analytics(db, date(2025, 8, 19), date(2025, 8, 19), cp_id="B", now=now)
+    assert list(only_b["charge_points"]) == ["B"]
+    assert only_b["fleet"]["durations"] == {"Available": 21600.0}
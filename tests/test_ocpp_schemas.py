@@ -0,0 +1,96 @@
+import pytest
+
+from server.ocpp_schemas import (
+    OcppError, parse_call, validate_payload, compile_schema,
+    PROTOCOL_ERROR, FORMATION_VIOLATION, PROPERTY_CONSTRAINT_VIOLATION,
+    OCCURENCE_CONSTRAINT_VIOLATION, TYPE_CONSTRAINT_VIOLATION, NOT_IMPLEMENTED,
+)
+
+STATUS = {"connectorId": 0, "errorCode": "NoError", "status": "Available"}
+BOOT = {"chargePointVendor": "MyVendor", "chargePointModel": "MyModel"}
+
+
+@pytest.mark.parametrize("action, payload", [
+    ("BootNotification", BOOT),
+    ("Heartbeat", {}),
+    ("StatusNotification", dict(STATUS, info="ok", timestamp="2025-08-19T10:00:00Z")),
+    ("StartTransaction", {"connectorId": 1, "idTag": "SIM", "meterStart": 0, "timestamp": "2025-08-19T10:00:00Z"}),
+    ("StopTransaction", {"transactionId": 1, "meterStop": 10, "timestamp": "2025-08-19T10:00:00Z", "reason": "Local"}),
+    ("MeterValues", {"connectorId": 1, "transactionId": 1, "meterValue": [
+        {"timestamp": "2025-08-19T10:00:00Z", "sampledValue": [{"value": "1", "phase": "L1", "unit": "A"}]}]}),
+])
+def test_valid_payloads(action, payload):
+    validate_payload(action, payload, "id")
+
+
+@pytest.mark.parametrize("action, payload, code, field", [
+    # type errors
+    ("StatusNotification", dict(STATUS, connectorId="0"), TYPE_CONSTRAINT_VIOLATION, "connectorId"),
+    ("StatusNotification", dict(STATUS, connectorId=True), TYPE_CONSTRAINT_VIOLATION, "connectorId"),  # bool is not int
+    ("StatusNotification", dict(STATUS, connectorId=1.5), TYPE_CONSTRAINT_VIOLATION, "connectorId"),
+    ("BootNotification", dict(BOOT, chargePointVendor=5), TYPE_CONSTRAINT_VIOLATION, "chargePointVendor"),
+    ("MeterValues", {"connectorId": 1, "meterValue": {}}, TYPE_CONSTRAINT_VIOLATION, "meterValue"),
+    ("MeterValues", {"connectorId": 1, "meterValue": [{"timestamp": "t", "sampledValue": [{"value": 1}]}]},
+     TYPE_CONSTRAINT_VIOLATION, "value"),
+    # enum, maxLength, minimum / maximum
+    ("StatusNotification", dict(STATUS, status="Broken"), PROPERTY_CONSTRAINT_VIOLATION, "status"),
+    ("StatusNotification", dict(STATUS, errorCode="Oops"), PROPERTY_CONSTRAINT_VIOLATION, "errorCode"),
+    ("BootNotification", dict(BOOT, chargePointVendor="x" * 21), PROPERTY_CONSTRAINT_VIOLATION, "chargePointVendor"),
+    ("StatusNotification", dict(STATUS, connectorId=-1), PROPERTY_CONSTRAINT_VIOLATION, "connectorId"),
+    ("MeterValues", {"connectorId": 1, "transactionId": 2 ** 70, "meterValue": []},
+     PROPERTY_CONSTRAINT_VIOLATION, "transactionId"),
+    # missing required fields
+    ("BootNotification", {"chargePointVendor": "MyVendor"}, OCCURENCE_CONSTRAINT_VIOLATION, "chargePointModel"),
+    ("StatusNotification", {"connectorId": 0, "status": "Available"}, OCCURENCE_CONSTRAINT_VIOLATION, "errorCode"),
+    ("MeterValues", {"connectorId": 1, "meterValue": [{"timestamp": "t", "sampledValue": [{}]}]},
+     OCCURENCE_CONSTRAINT_VIOLATION, "value"),
+    # additionalProperties
+    ("Heartbeat", {"cpId": "EVC_1"}, FORMATION_VIOLATION, "cpId"),
+    ("BootNotification", dict(BOOT, cpId="EVC_1"), FORMATION_VIOLATION, "cpId"),
+    # unsupported action
+    ("Reset", {}, NOT_IMPLEMENTED, "Reset"),
+])
+def test_invalid_payloads(action, payload, code, field):
+    with pytest.raises(OcppError) as e:
+        validate_payload(action, payload, "msg-1")
+    assert e.value.code == code
+    assert field in e.value.description
+    assert e.value.to_call_error()[:3] == [4, "msg-1", code]
+
+
+def test_sampled_out_validation_still_rejects_unknown_action():
+    validate_payload("StatusNotification", {"status": "whatever"}, "id", full=False)
+    with pytest.raises(OcppError) as e:
+        validate_payload("Reset", {}, "id", full=False)
+    assert e.value.code == NOT_IMPLEMENTED
+
+
+def test_compile_schema_additional_properties_allowed_by_default():
+    validate = compile_schema({"type": "object", "properties": {"a": {"type": "integer"}}})
+    validate({"a": 1, "b": "extra"})
+    with pytest.raises(OcppError):
+        validate({"a": "1"})
+
+
+def test_parse_call_valid_frames():
+    assert parse_call([2, "id", "Heartbeat", {}]) == ("id", "Heartbeat", {})
+    # optional 5th element carries trace metadata
+    assert parse_call([2, "id", "Heartbeat", {}, {"traceId": "id"}]) == ("id", "Heartbeat", {})
+
+
+@pytest.mark.parametrize("frame, code, message_id", [
+    ("not a list", PROTOCOL_ERROR, None),
+    ([2, "id"], PROTOCOL_ERROR, None),                            # too short
+    ([2, 1, "Heartbeat", {}], PROTOCOL_ERROR, None),               # message id not a string
+    ([5, "id", "Heartbeat", {}], PROTOCOL_ERROR, "id"),            # unknown message type
+    ([2, "id", "Heartbeat", {}, {}, {}], PROTOCOL_ERROR, "id"),    # too long
+    ([2, "id", "Heartbeat", {}, "trace"], PROTOCOL_ERROR, "id"),   # 5th element must be an object
+    ([2, "id", 7, {}], PROTOCOL_ERROR, "id"),                      # action not a string
+    ([2, "id", "Heartbeat", []], FORMATION_VIOLATION, "id"),       # payload not an object
+])
+def test_parse_call_invalid_frames(frame, code, message_id):
+    with pytest.raises(OcppError) as e:
+        parse_call(frame)
+    assert e.value.code == code
+    assert e.value.message_id == message_id
+    assert e.value.to_call_error()[1] == (message_id or "-1")
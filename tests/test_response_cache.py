@@ -0,0 +1,120 @@
+import gzip
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_cors")
+
+from backend import database
+from backend.response_cache import ResponseCache
+
+
+@pytest.fixture(scope="session")
+def backend_app(tmp_path_factory):
+    # backend.app deletes and recreates its db at import, so point it at a temp file first
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, "DB_PATH", str(tmp_path_factory.mktemp("backend") / "ocpp_logs.db"))
+        from backend import app as backend_app
+        yield backend_app
+
+
+@pytest.fixture
+def client(backend_app):
+    client = backend_app.app.test_client()
+    client.get("/api/charge_points")  # seeds the demo chargers on first use
+    return client
+
+
+def etag(response):
+    return response.get_etag()[0]
+
+
+def test_get_rebuilds_only_after_bump():
+    cache = ResponseCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return b'{"n": %d}' % len(builds)
+
+    first = cache.get("/x", build)
+    assert cache.get("/x", build) is first and len(builds) == 1
+    cache.bump()
+    second = cache.get("/x", build)
+    assert len(builds) == 2 and second.etag != first.etag and second.version == cache.version
+
+
+def test_bump_during_build_leaves_entry_stale():
+    cache = ResponseCache()
+
+    def build():
+        cache.bump()  # an ingest committed while the view was querying
+        return b"[]"
+
+    entry = cache.get("/x", build)
+    assert entry.version < cache.version
+    assert cache.get("/x", lambda: b"[]").version == cache.version
+
+
+def test_identical_rebuild_keeps_etag_and_gzip_body():
+    cache = ResponseCache()
+    entry = cache.get("/x", lambda: b"[1, 2, 3]")
+    compressed = cache.gzip_body(entry)
+    cache.bump()
+    again = cache.get("/x", lambda: b"[1, 2, 3]")
+    assert again is entry and again.etag == entry.etag and again.gzip_body is compressed
+
+
+def test_matching_etag_gets_304(client):
+    first = client.get("/api/charge_points")
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+
+    second = client.get("/api/charge_points", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.data == b""
+    assert etag(second) == etag(first)
+
+
+def test_ingest_changes_etag(client):
+    before = client.get("/api/charge_points")
+    cp_id = before.json[0]["cp_id"]
+    status = "Faulted" if before.json[0]["status"] != "Faulted" else "Available"
+
+    client.post("/statusnotification", json={"cpId": cp_id, "status": status})
+    after = client.get("/api/charge_points", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert etag(after) != etag(before)
+    assert after.json[0]["status"] == status
+
+
+def test_bump_without_change_keeps_etag(client, backend_app):
+    before = client.get("/api/charge_points")
+    backend_app.response_cache.bump()
+    after = client.get("/api/charge_points", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 304
+    assert etag(after) == etag(before)
+
+
+def test_gzip_body_matches_identity(client, backend_app, monkeypatch):
+    monkeypatch.setattr(backend_app.response_cache, "min_gzip_size", 0)
+    identity = client.get("/api/charge_points")
+    compressed = client.get("/api/charge_points", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in identity.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(compressed.data) == identity.data
+    assert etag(compressed) == etag(identity) + "-gz"
+
+    # the identity etag must not validate the gzip representation
+    revalidated = client.get("/api/charge_points",
+                             headers={"Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]})
+    assert revalidated.status_code == 200
+
+
+def test_cache_key_ignores_query_string(client, backend_app):
+    first = client.get("/api/charge_points?_=1")
+    second = client.get("/api/charge_points?_=2")
+    assert etag(first) == etag(second)
+    assert [key for key in backend_app.response_cache.entries if key.startswith("/api/charge_points")] == \
+        ["/api/charge_points"]